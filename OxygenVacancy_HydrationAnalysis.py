@@ -1,23 +1,39 @@
-def calculate_defect_hydration_energies(E_pristine, E_Vox, E_OHx):
-    # Constant energy values for H2O, H2, O2 (eV)
-    E_H2O = -14.891
-    E_H2 = -6.715
-    E_O2 = -9.896
+import numpy as np
+
+# Constant energy values for H2O, H2, O2 (eV)
+E_H2O = -14.891
+E_H2 = -6.715
+E_O2 = -9.896
+
+# Constant ZPE values (eV)
+ZPE_H2O = 0.56
+ZPE_H2 = 0.27
+ZPE_O2 = 0.10
+
+# Apply ZPE corrections (the gas references are fixed, so these are computed once at import)
+E_O2_corr = 2 * ((E_H2O + ZPE_H2O) - (E_H2 + ZPE_H2)) - ZPE_O2
+E_H2_corr = E_H2 + ZPE_H2
+E_H2O_corr = E_H2O + ZPE_H2O
 
-    # Constant ZPE values (eV)
-    ZPE_H2O = 0.56
-    ZPE_H2 = 0.27
-    ZPE_O2 = 0.10
+# Every defect energy is an affine function of (E_pristine, E_Vox, E_OHx): deltas = Defect_Coeffs @ E + Defect_Offsets
+# Rows: oxygen vacancy (Vox), protonic defect (OHx), hydration
+Defect_Coeffs = np.array([[-1.0, 1.0, 0.0],
+                          [-1.0, 0.0, 1.0],
+                          [-1.0, -1.0, 2.0]])
+Defect_Offsets = np.array([E_O2_corr / 2,
+                           -((E_H2O_corr - E_H2_corr / 2) / 2),
+                           -E_H2O_corr])
 
-    # Apply ZPE corrections
-    E_O2_corr = 2 * ((E_H2O + ZPE_H2O) - (E_H2 + ZPE_H2)) - ZPE_O2
-    E_H2_corr = E_H2 + ZPE_H2
-    E_H2O_corr = E_H2O + ZPE_H2O
+def _defect_hydration_kernel(E_pristine, E_Vox, E_OHx):
+    # Stack the total energies along the last axis so scalars and arrays over structures share one code path
+    E = np.stack(np.broadcast_arrays(*(np.asarray(E_tot, dtype=np.float64) for E_tot in (E_pristine, E_Vox, E_OHx))), axis=-1)
 
     # Calculate defect formation energies
-    delta_E_Vox = E_Vox - E_pristine + E_O2_corr / 2
-    delta_E_OHx = E_OHx - E_pristine - ((E_H2O_corr - E_H2_corr / 2) / 2)
-    delta_E_hydr = 2 * E_OHx - E_pristine - E_Vox - E_H2O_corr
+    deltas = E @ Defect_Coeffs.T + Defect_Offsets
+    return deltas[..., 0], deltas[..., 1], deltas[..., 2]
+
+def calculate_defect_hydration_energies(E_pristine, E_Vox, E_OHx):
+    delta_E_Vox, delta_E_OHx, delta_E_hydr = (float(delta) for delta in _defect_hydration_kernel(E_pristine, E_Vox, E_OHx))
 
     # Print corrected defect formation energies
     print(f"Corrected Defect Formation Energy for Oxygen Vacancy (Vox): {delta_E_Vox:.6f} eV")
@@ -27,10 +43,15 @@ def calculate_defect_hydration_energies(E_pristine, E_Vox, E_OHx):
     # Return results
     return delta_E_Vox, delta_E_OHx, delta_E_hydr
 
-# Example usage with manual input values for E_pristine, E_Vox, and E_OHx
-E_pristine = -331.28931146  # pristine material total energy (eV)
-E_Vox = -318.76206100     # Oxygen vacancy defect system total energy (eV)
-E_OHx = -333.11950727     # protonic defect system total energy (eV)
+def calculate_defect_hydration_energies_arr(E_pristine, E_Vox, E_OHx):
+    # Same energies as above for whole arrays of structures at once (e.g. a screening sweep), without printing
+    return tuple(delta[()] for delta in _defect_hydration_kernel(E_pristine, E_Vox, E_OHx))
+
+if __name__ == "__main__":
+    # Example usage with manual input values for E_pristine, E_Vox, and E_OHx
+    E_pristine = -331.28931146  # pristine material total energy (eV)
+    E_Vox = -318.76206100     # Oxygen vacancy defect system total energy (eV)
+    E_OHx = -333.11950727     # protonic defect system total energy (eV)
 
-# Call the function
-delta_E_Vox, delta_E_OHx, delta_E_hydr = calculate_defect_hydration_energies(E_pristine, E_Vox, E_OHx)
+    # Call the function
+    delta_E_Vox, delta_E_OHx, delta_E_hydr = calculate_defect_hydration_energies(E_pristine, E_Vox, E_OHx)
@@ -3,9 +3,14 @@
 ########################################### Headers and Imports #################################################
 import re
 import os
+import itertools
+import tempfile
 import subprocess
 import collections
 
+import pymatgen.core
+from monty.serialization import dumpfn, loadfn
+
 from pymatgen.core import Composition, periodic_table
 from pymatgen.entries.computed_entries import ComputedEntry
 
@@ -100,63 +105,84 @@ entries_VASP_C = [TestMat_entry_C]
 # print("entries_VASP_A:", entries_VASP_A)
 # print("entries_VASP_C:", entries_VASP_C)
 
-# Initialize MPRester to get material entries from the Materials Project
-api = MPRester('kzum4sPsW7GCRwtOqgDIr3zhYrfpaguK')
-
-# Fetch entries from Materials Project for the compound system under consideration
-entries_MP_Org_AC = api.get_entries_in_chemsys(['Ba','Zr','O','H'])
-entries_MP_Org_X = api.get_entries_in_chemsys(['Ba','Zr','O','C'])
-
-# Debugging: Print fetched entries from Materials Project
-# print("entries_MP_Org_AC:", entries_MP_Org_AC)
-# print("entries_MP_Org_X:", entries_MP_Org_X)
-
-# Process the entries using the compatibility module
-entries_MP_Org_AC = compat.process_entries(entries_MP_Org_AC)
-entries_MP_Org_X = compat.process_entries(entries_MP_Org_X)
+# Directory holding processed Materials Project entries between runs
+MP_Cache_Dir = '.mp_cache'
+
+# Set to True to ignore the cached entries and download them again, e.g. after a Materials Project database release
+# The cache is not keyed on the MP database version, since looking it up would cost a network round-trip on every run
+Refresh_MP_Cache = False
+
+def get_subsystems(elements):
+    # Every chemical system spanned by the elements (Ba, Ba-O, Ba-O-Zr, ...), the same subsystems get_entries_in_chemsys expands to
+    return {'-'.join(sorted(els)) for n in range(1, len(elements) + 1) for els in itertools.combinations(elements, n)}
+
+def get_cache_file(chemsys_list):
+    # Cache file for the processed entries of several chemical systems
+    # The pymatgen version is part of the key because the compatibility corrections change between releases
+    return os.path.join(MP_Cache_Dir, '_'.join('-'.join(sorted(chemsys)) for chemsys in chemsys_list) + '_pmg' + pymatgen.core.__version__ + '.json')
+
+def fetch_processed_entries(api, chemsys_list, cache_file):
+    # Fetch the entries of several chemical systems, process them with the compatibility module and store them in cache_file
+    # Batch exactly the subsystems needed into one query instead of one get_entries_in_chemsys call per system
+    # get_entries_in_chemsys restricts the thermo documents to GGA_GGA+U by default, while a bare get_entries does not,
+    # so the same filter is passed explicitly to get the same entries (no r2SCAN or mixed-scheme duplicates)
+    subsystems = sorted(set().union(*(get_subsystems(chemsys) for chemsys in chemsys_list)))
+    entries = compat.process_entries(api.get_entries(subsystems, additional_criteria={"thermo_types": ["GGA_GGA+U"]}))
+    os.makedirs(MP_Cache_Dir, exist_ok=True)
+
+    # Write to a temporary file first so an interrupted run cannot leave a truncated cache behind
+    fd, tmp_file = tempfile.mkstemp(dir=MP_Cache_Dir, suffix='.json')
+    os.close(fd)
+    try:
+        dumpfn(entries, tmp_file)
+        os.replace(tmp_file, cache_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+    return entries
+
+# Chemical systems needed for conditions A/C and X
+chemsys_AC = {'Ba','Zr','O','H'}
+chemsys_X = {'Ba','Zr','O','C'}
+
+# Reuse the processed entries from a previous run when they exist, without opening a Materials Project session
+cache_file_MP = get_cache_file([chemsys_AC, chemsys_X])
+if os.path.exists(cache_file_MP) and not Refresh_MP_Cache:
+    entries_MP_Org = loadfn(cache_file_MP)
+else:
+    # Initialize MPRester to get material entries from the Materials Project
+    with MPRester('kzum4sPsW7GCRwtOqgDIr3zhYrfpaguK') as api:
+        # Fetch the subsystems of both chemical systems in a single query
+        entries_MP_Org = fetch_processed_entries(api, [chemsys_AC, chemsys_X], cache_file_MP)
+
+# Split the fetched entries back into the chemical system of each condition
+entries_MP_Org_AC = [e for e in entries_MP_Org if {el.symbol for el in e.composition.elements} <= chemsys_AC]
+entries_MP_Org_X = [e for e in entries_MP_Org if {el.symbol for el in e.composition.elements} <= chemsys_X]
 
 # Debugging: Print processed entries
 # print("Processed entries_MP_Org_AC:", entries_MP_Org_AC)
 # print("Processed entries_MP_Org_X:", entries_MP_Org_X)
 
-# Combine the entries with VASP computed entries
-all_entries_A = entries_MP_Org_AC + entries_VASP_A
-all_entries_C = entries_MP_Org_AC + entries_VASP_C
+# Entries for condition X, rewritten in place by the CO2 filtering below
 entriesTotal_X = entries_MP_Org_X
 
-# Debugging: Print reduced formulas for condition A entries horizontally
-# print("Entries for condition A:")
-# print(" | ".join([entry.composition.reduced_formula for entry in all_entries_A]))
+# Debugging: Print reduced formulas for the MP entries of conditions A and C horizontally
+# print("MP entries for conditions A and C:")
+# print(" | ".join([entry.composition.reduced_formula for entry in entries_MP_Org_AC]))
 ##################################### Eliminate H2 and O2 MP Entries ###########################################
 
-# Filter out H2, O2, and H2O from the list of all entries
-H2_entries_A = [e for e in all_entries_A if e.composition.reduced_formula == 'H2']
-O2_entries_A = [e for e in all_entries_A if e.composition.reduced_formula == 'O2']
-H2O_entries_A = [e for e in all_entries_A if e.composition.reduced_formula == 'H2O']
-
-# Debugging: Print filtered entries for condition A
-# print("Filtered H2 entries for condition A:", H2_entries_A)
-# print("Filtered O2 entries for condition A:", O2_entries_A)
-# print("Filtered H2O entries for condition A:", H2O_entries_A)
-
-# Filter out H2, O2, and H2O from the list of all entries
-H2_entries_C = [e for e in all_entries_C if e.composition.reduced_formula == 'H2']
-O2_entries_C = [e for e in all_entries_C if e.composition.reduced_formula == 'O2']
-H2O_entries_C = [e for e in all_entries_C if e.composition.reduced_formula == 'H2O']
-
-# Debugging: Print filtered entries for condition C
-# print("Filtered H2 entries for condition C:", H2_entries_C)
-# print("Filtered O2 entries for condition C:", O2_entries_C)
-# print("Filtered H2O entries for condition C:", H2O_entries_C)
-
-# Filter out H2, O2, and H2O from the list of all entries
-eliminate_AC = ['H2', 'O2', 'H2O']
+# Debugging: Print the H2, O2, and H2O MP entries that are replaced by the gas entries of conditions A and C
+# print("Filtered H2 entries for conditions A and C:", [e for e in entries_MP_Org_AC if e.composition.reduced_formula == 'H2'])
+# print("Filtered O2 entries for conditions A and C:", [e for e in entries_MP_Org_AC if e.composition.reduced_formula == 'O2'])
+# print("Filtered H2O entries for conditions A and C:", [e for e in entries_MP_Org_AC if e.composition.reduced_formula == 'H2O'])
 
-all_entries_A = list(filter(lambda e: e.composition.reduced_formula not in eliminate_AC, all_entries_A))
-all_entries_A =all_entries_A +entriesGases_A
+# Filter out H2, O2, and H2O from the MP entries once, since conditions A and C share the same Ba-Zr-O-H entries
+# The names are normalized through Composition once so they match the reduced formulas pymatgen reports
+eliminate_AC = frozenset(Composition(f).reduced_formula for f in ['H2', 'O2', 'H2O'])
+entries_MP_Filtered_AC = [e for e in entries_MP_Org_AC if e.composition.reduced_formula not in eliminate_AC]
 
-all_entries_C = list(filter(lambda e: e.composition.reduced_formula not in eliminate_AC,  all_entries_C))
-all_entries_C =all_entries_C +entriesGases_C
+all_entries_A = [*entries_MP_Filtered_AC, *entries_VASP_A, *entriesGases_A]
+all_entries_C = [*entries_MP_Filtered_AC, *entries_VASP_C, *entriesGases_C]
 
 # Debugging: check if the entries contain the gases 
 # for entry in entriesGases_A:
@@ -210,14 +236,15 @@ print('*************************************************************************
 print("Phase diagram for Hydrogen-rich condition:", pd_A)
 print("every energy is per atom: ",TestMat_entry_A.energy / 16)
 print(f"Hull energy for compound Ba8Zr8O24: {pd_A.get_hull_energy(TestMat_entry_A.composition)/16}")
-print("Energy above convex hull:",TestMat_entry_A.energy / 16 - pd_A.get_hull_energy_per_atom(TestMat_entry_A.composition))
+E_Above_Hull_A = TestMat_entry_A.energy / 16 - pd_A.get_hull_energy_per_atom(TestMat_entry_A.composition)
+print("Energy above convex hull:",E_Above_Hull_A)
 # plotter = PDPlotter(pd_A)
 # plotter.show()
 
 # Write results to file
 with open('Anode_Ba8Zr8O24.txt', 'w') as out_file:
     print(TestMat_Comp, file=out_file)
-    print(TestMat_entry_A.energy / 16 - pd_A.get_hull_energy_per_atom(TestMat_entry_A.composition), file=out_file)
+    print(E_Above_Hull_A, file=out_file)
     print('************************************************************************************************')
 # Locked chemical potentials for condition C
 locked_Chem_Potential_C = {'O2': O_Ener_C*2,'H2': H_Ener_C*2}
@@ -229,13 +256,14 @@ pd_C = GrandPotentialPhaseDiagram(all_entries_C, locked_Chem_Potential_C)
 print("Phase diagram for Oxygen-rich condition:",pd_C)
 print("every energy is per atom: ", TestMat_entry_C.energy / 16)
 print(f"Hull energy for compound Ba8Zr8O24: {pd_C.get_hull_energy(TestMat_entry_C.composition)/16}")
-print("Energy above convex hull:",TestMat_entry_C.energy / 16 - pd_C.get_hull_energy_per_atom(TestMat_entry_C.composition))
+E_Above_Hull_C = TestMat_entry_C.energy / 16 - pd_C.get_hull_energy_per_atom(TestMat_entry_C.composition)
+print("Energy above convex hull:",E_Above_Hull_C)
 # plotter = PDPlotter(pd_C)
 # plotter.show()
 # Write results to file
 with open('Cathode_Ba8Zr8O24.txt', 'w') as out_file:
     print(TestMat_Comp, file=out_file)
-    print(TestMat_entry_C.energy / 16 - pd_C.get_hull_energy_per_atom(TestMat_entry_C.composition), file=out_file)
+    print(E_Above_Hull_C, file=out_file)
     print('************************************************************************************************')
 ########################################## Filtering CO2 as Element X ###########################################
 
@@ -451,16 +479,17 @@ for j in range(0,len(entriesTotal_X)):
 
 #################################### Gas Phase Correction CO2 ###################################################
 
-CO_entries_X = [e for e in entriesTotal_X if e.composition.reduced_formula == 'CO']
-CO2_entries_X = [e for e in entriesTotal_X if e.composition.reduced_formula == 'X']
-O2_entries_X = [e for e in entriesTotal_X if e.composition.reduced_formula == 'O2']
+# Debugging: Print the CO, CO2 (X), and O2 entries that are replaced by the gas entries of condition X
+# print("Filtered CO entries for condition X:", [e for e in entriesTotal_X if e.composition.reduced_formula == 'CO'])
+# print("Filtered X entries for condition X:", [e for e in entriesTotal_X if e.composition.reduced_formula == 'X'])
+# print("Filtered O2 entries for condition X:", [e for e in entriesTotal_X if e.composition.reduced_formula == 'O2'])
 
-eliminate_X = ['CO', 'X', 'O2']
-all_entries_X = list(filter(lambda e: e.composition.reduced_formula not in eliminate_X, entriesTotal_X))
+eliminate_X = frozenset(Composition(f).reduced_formula for f in ['CO', 'X', 'O2'])
+entries_Filtered_X = [e for e in entriesTotal_X if e.composition.reduced_formula not in eliminate_X]
 
 TestMat_entry_X = ComputedEntry(TestMat_Comp, TestMat_Ener - O_Ener_X * 24)
 entries_VASP_X = [TestMat_entry_X]
-all_entries_X = all_entries_X + entries_VASP_X + entriesGases_X
+all_entries_X = [*entries_Filtered_X, *entries_VASP_X, *entriesGases_X]
 
 ############################ Calculate Convex Hull under Environmental Conditions ###############################
 
@@ -474,12 +503,13 @@ pd_X = GrandPotentialPhaseDiagram(all_entries_X, locked_Chem_Potential_X)
 print("Phase diagram for CO2-rich condition:",pd_X)
 print("every energy is per atom: ",TestMat_entry_X.energy / 16)
 print(f"Hull energy for compound Ba8Zr8O24: {pd_X.get_hull_energy(TestMat_entry_X.composition)/16}")
-print("Energy above convex hull:",TestMat_entry_X.energy / 16 - pd_X.get_hull_energy_per_atom(TestMat_entry_X.composition))
+E_Above_Hull_X = TestMat_entry_X.energy / 16 - pd_X.get_hull_energy_per_atom(TestMat_entry_X.composition)
+print("Energy above convex hull:",E_Above_Hull_X)
 # plotter = PDPlotter(pd_X)
 # plotter.show()
 # Write results to file
 with open('CO2_Ba8Zr8O24_X.txt', 'w') as out_file:
     print(TestMat_Comp, file=out_file)
-    print(TestMat_entry_X.energy / 16 - pd_X.get_hull_energy_per_atom(TestMat_entry_X.composition), file=out_file)
+    print(E_Above_Hull_X, file=out_file)
 print('************************************************************************************************')
 